@@ -2,11 +2,43 @@
 """Main backup script entry point."""
 
 import argparse
+import logging
+import logging.handlers
+import queue
+import signal
 import sys
 
 from src.backup.config import get_settings
+from src.backup.process import terminate_spawned
 from src.backup.service import BackupService
 
+logger = logging.getLogger(__name__)
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Route log records through a queue so output is written on a background thread."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    logging.getLogger().addHandler(logging.handlers.QueueHandler(log_queue))
+    
+    # Keep third-party libraries at their default WARNING level
+    for name in (__name__, "src.backup"):
+        logging.getLogger(name).setLevel(logging.INFO)
+    
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
+def handle_sigterm(signum: int, frame: object) -> None:
+    """Stop running dumps and compressors, then exit through the normal cleanup path."""
+    # Stage threads wait on their subprocesses, so stop those before unwinding
+    terminate_spawned()
+    logger.error("\nBackup terminated")
+    sys.exit(128 + signum)
+
 
 def main() -> None:
     """Main entry point for the backup script."""
@@ -25,6 +57,9 @@ def main() -> None:
     elif args.files and not args.mysql:
         backup_mysql = False
     
+    listener = setup_logging()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    
     try:
         # Load settings
         settings = get_settings()
@@ -33,14 +68,17 @@ def main() -> None:
         backup_service = BackupService(settings)
         backup_service.run_backup(backup_mysql=backup_mysql, backup_files=backup_files)
         
-        print("Backup process completed successfully!")
+        logger.info("Backup process completed successfully!")
         
     except KeyboardInterrupt:
-        print("\nBackup interrupted by user")
+        logger.error("\nBackup interrupted by user")
         sys.exit(130)
     except Exception as e:
-        print(f"Backup failed: {e}")
+        logger.error(f"Backup failed: {e}")
         sys.exit(1)
+    finally:
+        # Flush queued records before the process exits
+        listener.stop()
 
 
 if __name__ == "__main__":
@@ -1,18 +1,31 @@
 """Google Drive authentication for headless environments."""
 
+import logging
 import os.path
+import queue
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
+import httplib2
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
 from .config import GoogleDriveConfig
 
+logger = logging.getLogger(__name__)
+
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
+# Socket timeout in seconds for Drive API connections
+HTTP_TIMEOUT = 60
+
+# Idle Drive connections kept open for reuse
+POOL_SIZE = 4
+
 
 class GoogleDriveAuth:
     """Handle Google Drive authentication for headless environments."""
@@ -20,6 +33,9 @@ class GoogleDriveAuth:
     def __init__(self, config: GoogleDriveConfig):
         self.config = config
         self._service = None
+        self._creds = None
+        # Most recently used transports first, so their connections are warm
+        self._pool: queue.LifoQueue = queue.LifoQueue(maxsize=POOL_SIZE)
     
     def authenticate_headless(self) -> None:
         """Authenticate using manual flow for headless servers."""
@@ -27,19 +43,33 @@ class GoogleDriveAuth:
         
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
-                print("Refreshing expired token...")
+                logger.info("Refreshing expired token...")
                 creds.refresh(Request())
             else:
-                print("No valid credentials found. Starting authentication flow...")
+                logger.info("No valid credentials found. Starting authentication flow...")
                 creds = self._get_new_credentials()
             
             self._save_credentials(creds)
         
-        self._service = build('drive', 'v3', credentials=creds)
-        print("Successfully authenticated with Google Drive")
+        # Refreshing updates the loaded credentials in place, so the built
+        # service and its transports stay usable
+        if self._service is not None and creds is self._creds:
+            return
+        
+        self._creds = creds
+        # Use the bundled discovery document and a keep-alive transport
+        self._service = build(
+            'drive', 'v3',
+            http=self._new_http(),
+            cache_discovery=False,
+            static_discovery=True
+        )
+        logger.info("Successfully authenticated with Google Drive")
     
     def _load_existing_credentials(self) -> Optional[Credentials]:
-        """Load existing credentials from token file."""
+        """Load existing credentials, reusing the ones already loaded."""
+        if self._creds is not None:
+            return self._creds
         if self.config.token_file.exists():
             return Credentials.from_authorized_user_file(str(self.config.token_file), SCOPES)
         return None
@@ -59,19 +89,19 @@ class GoogleDriveAuth:
         
         # Try local server flow first
         try:
-            print("Starting local server for authentication...")
+            logger.info("Starting local server for authentication...")
             creds = flow.run_local_server(port=0)
             return creds
         except Exception as e:
-            print(f"Local server authentication failed: {e}")
-            print("\n" + "="*60)
-            print("HEADLESS SERVER INSTRUCTIONS:")
-            print("="*60)
-            print("1. Run this tool on a machine with a browser first")
-            print("2. Complete the authentication there")
-            print("3. Copy the generated 'credentials/token.json' to this server")
-            print("4. Then run the backup tool on this server")
-            print("="*60)
+            logger.error(f"Local server authentication failed: {e}")
+            logger.info("\n" + "="*60)
+            logger.info("HEADLESS SERVER INSTRUCTIONS:")
+            logger.info("="*60)
+            logger.info("1. Run this tool on a machine with a browser first")
+            logger.info("2. Complete the authentication there")
+            logger.info("3. Copy the generated 'credentials/token.json' to this server")
+            logger.info("4. Then run the backup tool on this server")
+            logger.info("="*60)
             raise RuntimeError("Authentication failed. See instructions above for headless servers.")
     
     def _save_credentials(self, creds: Credentials) -> None:
@@ -79,7 +109,12 @@ class GoogleDriveAuth:
         self.config.token_file.parent.mkdir(parents=True, exist_ok=True)
         with open(self.config.token_file, 'w') as token:
             token.write(creds.to_json())
-        print(f"Credentials saved to {self.config.token_file}")
+        logger.info(f"Credentials saved to {self.config.token_file}")
+    
+    @property
+    def is_authenticated(self) -> bool:
+        """Check whether a service with unexpired credentials is available."""
+        return self._service is not None and self._creds is not None and not self._creds.expired
     
     @property
     def service(self):
@@ -88,11 +123,42 @@ class GoogleDriveAuth:
             raise RuntimeError("Not authenticated. Call authenticate_headless() first.")
         return self._service
     
+    @contextmanager
+    def connection(self) -> Iterator[AuthorizedHttp]:
+        """Borrow an authorized HTTP transport from the connection pool.
+        
+        httplib2 connections are not thread-safe, so each transport is used
+        by one caller at a time. Returned transports keep their TLS
+        connection open for the next request from any thread.
+        """
+        if self._creds is None:
+            raise RuntimeError("Not authenticated. Call authenticate_headless() first.")
+        
+        try:
+            http = self._pool.get_nowait()
+        except queue.Empty:
+            http = self._new_http()
+        
+        try:
+            yield http
+        finally:
+            # Drop transports left over from replaced credentials or beyond the pool size
+            if http.credentials is self._creds:
+                try:
+                    self._pool.put_nowait(http)
+                except queue.Full:
+                    http.close()
+    
+    def _new_http(self) -> AuthorizedHttp:
+        """Create an authorized keep-alive HTTP transport."""
+        return AuthorizedHttp(self._creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    
     def test_connection(self) -> bool:
         """Test the connection to Google Drive."""
         try:
-            self.service.about().get(fields="user").execute()
+            with self.connection() as http:
+                self.service.about().get(fields="user").execute(http=http)
             return True
         except Exception as e:
-            print(f"Connection test failed: {e}")
+            logger.error(f"Connection test failed: {e}")
             return False
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""Compression helpers shared by backup modules."""
+
+import logging
+import os
+import shutil
+from functools import lru_cache
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+MIME_TYPES = {"gzip": "application/gzip", "zstd": "application/zstd"}
+
+# Fast levels that keep nearly all of the ratio of the slow ones
+DEFAULT_LEVELS = {"gzip": 1, "zstd": 3}
+
+# Levels accepted by every tool of a format (pigz rejects 10, gzip stops at 9)
+LEVEL_RANGES = {"gzip": (1, 9), "zstd": (1, 19)}
+
+# Log2 of the zstd long distance matching window (128 MiB)
+LONG_WINDOW_LOG = 27
+
+
+@lru_cache(maxsize=None)
+def find_binary(name: str) -> Optional[str]:
+    """Get absolute path of a compressor binary, looked up once per process.
+    
+    Directory and file items each build a compressor command, so caching
+    avoids scanning PATH for every item and lets exec skip the PATH search.
+    """
+    return shutil.which(name)
+
+
+def resolve_format(compression_format: str) -> str:
+    """Get usable compression format, falling back to gzip if zstd is missing."""
+    if compression_format == "zstd" and find_binary("zstd") is None:
+        logger.warning("Warning: zstd not found, falling back to gzip compression")
+        return "gzip"
+    return compression_format
+
+
+def resolve_level(compression_format: str, level: Optional[int]) -> int:
+    """Get compression level, using the format's default when unset.
+    
+    Levels outside the format's range are clamped, so a zstd level such as
+    10 still works when gzip is configured or used as the fallback.
+    """
+    if level is None:
+        return DEFAULT_LEVELS[compression_format]
+    low, high = LEVEL_RANGES[compression_format]
+    return min(max(level, low), high)
+
+
+def compressed_suffix(compression_format: str) -> str:
+    """Get file suffix for compressed output, e.g. '.zst'."""
+    return SUFFIXES[compression_format]
+
+
+def compressed_mimetype(compression_format: str) -> str:
+    """Get MIME type for compressed output."""
+    return MIME_TYPES[compression_format]
+
+
+def compressor_command(compression_format: str, level: int, long_window: bool = False) -> List[str]:
+    """Get command line compressing stdin to stdout in the given format.
+    
+    level must come from resolve_level, which keeps it in the format's range.
+    long_window enables zstd long distance matching over a 128 MiB window,
+    which restores need to allow with 'zstd -d --long=27'.
+    """
+    if compression_format == "zstd":
+        cmd = [find_binary("zstd") or "zstd", "-T0", f"-{level}", "-q", "-c"]
+        if long_window:
+            cmd.append(f"--long={LONG_WINDOW_LOG}")
+        return cmd
+    return gzip_command(level)
+
+
+def parallel_gzip_command(level: int) -> Optional[List[str]]:
+    """Get pigz command line writing gzip to stdout, or None if pigz is missing."""
+    pigz = find_binary("pigz")
+    if pigz is None:
+        return None
+    return [pigz, f"-{level}", "-p", str(os.cpu_count() or 1), "-c"]
+
+
+def gzip_command(level: int) -> List[str]:
+    """Get gzip command line writing to stdout, preferring pigz over gzip."""
+    pigz_cmd = parallel_gzip_command(level)
+    if pigz_cmd is not None:
+        return pigz_cmd
+    return [find_binary("gzip") or "gzip", f"-{level}", "-c"]
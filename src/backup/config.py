@@ -1,7 +1,8 @@
 """Configuration settings using Pydantic v2."""
 
+import tempfile
 from pathlib import Path
-from typing import List, Optional
+from typing import FrozenSet, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -14,7 +15,7 @@ class GoogleDriveConfig(BaseModel):
     token_file: Path = Field(default=Path("credentials/token.json"), description="Stored auth token file")
     folder_id: Optional[str] = Field(default=None, description="Google Drive folder ID to upload to")
     folder_name: str = Field(default="Server Backups", description="Google Drive folder name to create/use")
-    chunk_size: int = Field(default=1024*1024, description="Upload chunk size in bytes")
+    chunk_size: int = Field(default=32*1024*1024, description="Upload chunk size in bytes")
 
 
 class BackupSettings(BaseSettings):
@@ -30,10 +31,26 @@ class BackupSettings(BaseSettings):
     
     # Files configuration
     files_config_path: Path = Field(default=Path("files_config.json"), description="Path to files configuration JSON")
+    snar_dir: Path = Field(default=Path("snar"), description="Directory for incremental backup snapshot files")
+    skip_if_unchanged: bool = Field(default=True, description="Copy the previous Drive backup of items whose files have not changed")
+    manifest_file: Path = Field(default=Path.home() / ".cache" / "backup_manager" / "manifest.json", description="Where file fingerprints of previous runs are kept")
     
     # Backup settings
+    temp_dir: Path = Field(default=Path(tempfile.gettempdir()) / "backup", description="Staging directory for backup archives")
     backup_name_prefix: str = Field(default="server-backup", description="Prefix for backup file names")
-    compression_level: int = Field(default=6, description="Compression level (0-9)")
+    compression_format: Literal["gzip", "zstd"] = Field(default="zstd", description="Compression format for archives")
+    compression_level: Optional[int] = Field(default=None, description="Compression level (1-9 for gzip, 1-19 for zstd, default 1 for gzip and 3 for zstd)")
+    long_window: bool = Field(default=True, description="Use a 128 MiB zstd window to find repeats across files (restore with zstd -d --long=27)")
+    mysql_compression_level: Optional[int] = Field(default=None, description="Compression level for MySQL dumps (defaults to compression_level)")
+    files_compression_level: Optional[int] = Field(default=None, description="Compression level for files backups (defaults to compression_level)")
+    backup_nice: int = Field(default=10, description="Niceness for dump and compression processes (0 = unchanged)")
+    backup_cpu_set: FrozenSet[int] = Field(default=frozenset(), description="CPUs dump and compression processes may run on (empty = all)")
+    backup_io_idle: bool = Field(default=True, description="Run dump and compression processes in the idle I/O class")
+    concurrent_backups: int = Field(default=2, description="Number of file backup items processed concurrently")
+    enabled_stages: List[Literal["mysql", "files"]] = Field(default=["mysql", "files"], description="Backup stages to run")
+    combined_archive: bool = Field(default=False, description="Upload MySQL dumps and files together as one archive")
+    stream_upload: bool = Field(default=True, description="Upload archives while they are being created instead of staging them on disk")
+    memory_staging: bool = Field(default=False, description="Stage archives that cannot be streamed in memory instead of the temp directory")
     
     # Separate backup policies
     max_database_backups: int = Field(default=50, description="Maximum number of database backups to keep")
@@ -47,6 +64,24 @@ class BackupSettings(BaseSettings):
     mysql_user: str = Field(default="backup_user")
     mysql_password: str = Field(default="")
     mysql_databases: str = Field(default="", description="Comma-separated databases to backup")
+    mysql_backend: Literal["mysqldump", "mydumper"] = Field(default="mysqldump", description="Dump tool to use")
+    mysql_threads: int = Field(default=4, description="Dump threads when using mydumper")
+    mysql_parallelism: int = Field(default=1, description="Databases dumped in parallel by mysqldump")
+    mysql_compress: bool = Field(default=True, description="Compress the client/server protocol while dumping")
+    mysql_quick: bool = Field(default=True, description="Stream rows instead of buffering whole tables")
+    mysql_compact: bool = Field(default=False, description="Omit comments and SET statements from dumps")
+    
+    def get_mysql_compression_level(self) -> Optional[int]:
+        """Get compression level for MySQL dumps."""
+        if self.mysql_compression_level is not None:
+            return self.mysql_compression_level
+        return self.compression_level
+    
+    def get_files_compression_level(self) -> Optional[int]:
+        """Get compression level for files backups."""
+        if self.files_compression_level is not None:
+            return self.files_compression_level
+        return self.compression_level
     
     def get_mysql_databases(self) -> List[str]:
         """Get MySQL databases as a list."""
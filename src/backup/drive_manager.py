@@ -1,13 +1,193 @@
 """Google Drive operations manager."""
 
+import logging
+import mimetypes
+import mmap
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
 
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import BatchHttpRequest, HttpRequest, MediaIoBaseUpload, MediaUpload
 
 from .auth import GoogleDriveAuth
 from .config import GoogleDriveConfig
 
+logger = logging.getLogger(__name__)
+
+# Drive accepts at most 100 calls in a single batch request
+BATCH_SIZE = 100
+
+# Largest page size accepted by files.list
+LIST_PAGE_SIZE = 1000
+
+# Upload progress is reported in steps of this many percent
+PROGRESS_STEP = 5
+
+# Files below this size are sent in a single multipart request
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+
+# Retries with exponential backoff for upload requests failing with 5xx or 429
+UPLOAD_RETRIES = 5
+
+# Run timestamp embedded in backup names, e.g. ..._20240101_120000.tar.zst
+NAME_TIMESTAMP = re.compile(r"_(\d{8})_\d{6}\.")
+
+
+def _guess_mimetype(name: str) -> str:
+    """Guess MIME type from file name the way MediaFileUpload does."""
+    mimetype, _ = mimetypes.guess_type(name)
+    return mimetype or 'application/octet-stream'
+
+
+def _backup_week(name: str) -> Optional[Tuple[int, int]]:
+    """Get ISO (year, week) of the run that uploaded a backup, from its name."""
+    match = NAME_TIMESTAMP.search(name)
+    if match is None:
+        return None
+    year, week, _ = datetime.strptime(match.group(1), "%Y%m%d").isocalendar()
+    return year, week
+
+
+def _excess_files(files: List[Dict[str, str]], max_backups: int, weekly: bool) -> List[str]:
+    """Get IDs of files past the limit from a newest first listing.
+    
+    With weekly, max_backups counts weeks of incremental chains instead of
+    files, so a chain is only deleted as a whole and the current week's
+    chain, being the newest, is always kept. Files whose names carry no
+    timestamp are never deleted.
+    """
+    if not weekly:
+        return [file['id'] for file in files[max_backups:]]
+    
+    weeks: List[Tuple[int, int]] = []
+    excess = []
+    for file in files:
+        week = _backup_week(file['name'])
+        if week is None:
+            continue
+        if week not in weeks:
+            weeks.append(week)
+        if weeks.index(week) >= max_backups:
+            excess.append(file['id'])
+    return excess
+
+
+def _escape(value: str) -> str:
+    """Escape value for use inside a quoted Drive query string."""
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+class MappedUpload(MediaIoBaseUpload):
+    """Resumable upload of a memory-mapped file.
+    
+    MediaIoBaseUpload hands each chunk to the HTTP client as a one-shot
+    stream slice, which is empty when a failed chunk is retried. Without
+    the stream interface every attempt gets the chunk as a slice of the
+    mapping instead.
+    """
+    
+    def has_stream(self) -> bool:
+        return False
+
+
+class StreamUpload(MediaUpload):
+    """Resumable upload of a non-seekable stream of unknown length.
+    
+    Data is buffered from the stream one chunk ahead of the upload so the
+    total size is known before the last chunk is sent, and so a chunk can
+    be resent after a partial write. The stream is read straight into one
+    preallocated buffer holding at most two chunks, so the only copy made
+    in Python is the chunk handed to the HTTP client.
+    """
+    
+    def __init__(self, stream: BinaryIO, mimetype: str, chunksize: int):
+        self._stream = stream
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+        self._buffer = bytearray(2 * chunksize + 1)
+        # Buffered data spans _buffer[_start:_end] and begins at stream _offset
+        self._start = 0
+        self._end = 0
+        self._offset = 0
+        self._size: Optional[int] = None
+    
+    def chunksize(self) -> int:
+        return self._chunksize
+    
+    def mimetype(self) -> str:
+        return self._mimetype
+    
+    def size(self) -> Optional[int]:
+        # The next chunk starts at most one chunk past the buffer start
+        self._fill(2 * self._chunksize + 1)
+        return self._size
+    
+    def resumable(self) -> bool:
+        return True
+    
+    def has_stream(self) -> bool:
+        return False
+    
+    def getbytes(self, begin: int, length: int) -> bytes:
+        if begin < self._offset:
+            raise ValueError("Cannot rewind a streamed upload")
+        
+        # Data before begin has been acknowledged by Drive
+        self._start = min(self._start + begin - self._offset, self._end)
+        self._offset = begin
+        self._fill(length)
+        with memoryview(self._buffer) as view:
+            return view[self._start:min(self._start + length, self._end)].tobytes()
+    
+    def _fill(self, length: int) -> None:
+        """Read from the stream until length bytes are buffered or EOF."""
+        if self._size is not None or self._end - self._start >= length:
+            return
+        
+        with memoryview(self._buffer) as view:
+            # Move the unacknowledged tail to the front to make room
+            if self._start + length > len(self._buffer):
+                view[:self._end - self._start] = view[self._start:self._end]
+                self._end -= self._start
+                self._start = 0
+            
+            while self._end - self._start < length:
+                read = self._stream.readinto(view[self._end:self._start + length])
+                if not read:
+                    self._size = self._offset + self._end - self._start
+                    break
+                self._end += read
+
+
+class RotationBatch:
+    """Cleanups of old backups collected during a run and executed together.
+    
+    Listing every rotated location and deleting the files past each limit
+    both go out as batch requests, so the whole rotation costs a couple of
+    round trips instead of one or more per location.
+    """
+    
+    def __init__(self, manager: "GoogleDriveManager"):
+        self._manager = manager
+        self._rules: List[Tuple[str, int, str, bool]] = []
+        self._lock = threading.Lock()
+    
+    def add(self, query: str, max_backups: int, backup_type: str, weekly: bool = False) -> None:
+        """Queue cleanup keeping the newest max_backups files (or weekly chains) matching query."""
+        with self._lock:
+            self._rules.append((query, max_backups, backup_type, weekly))
+    
+    def execute(self) -> None:
+        """Run all queued cleanups."""
+        with self._lock:
+            rules, self._rules = self._rules, []
+        if rules:
+            self._manager._rotate(rules)
+
 
 class GoogleDriveManager:
     """Handles all Google Drive operations."""
@@ -18,26 +198,55 @@ class GoogleDriveManager:
         self._main_folder_id = None
         self._database_folder_id = None
         self._files_folder_id = None
+        self._auth_future: Optional[Future] = None
+        # Folder IDs by (parent ID, name), kept for the lifetime of the manager
+        self._folder_ids: Dict[Tuple[Optional[str], str], str] = {}
     
     def authenticate(self) -> None:
-        """Authenticate with Google Drive."""
+        """Authenticate with Google Drive, reusing a still valid session."""
+        if self.auth.is_authenticated and self._files_folder_id is not None:
+            return
+        
         self.auth.authenticate_headless()
         if not self.auth.test_connection():
             raise RuntimeError("Failed to connect to Google Drive")
         self._setup_folders()
     
-    def _get_or_create_folder(self, folder_name: str, parent_id: Optional[str] = None) -> str:
-        """Get existing folder or create new one."""
-        query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
+    def authenticate_in_background(self) -> None:
+        """Start authenticating on a background thread; Drive calls wait for it."""
+        executor = ThreadPoolExecutor(max_workers=1)
+        self._auth_future = executor.submit(self.authenticate)
+        executor.shutdown(wait=False)
+    
+    def wait_authenticated(self) -> None:
+        """Wait for background authentication, re-raising its error."""
+        if self._auth_future is not None:
+            self._auth_future.result()
+    
+    def _folder_query(self, folder_name: str, parent_id: Optional[str] = None) -> str:
+        """Build query matching a folder by name and optional parent."""
+        query = f"name='{_escape(folder_name)}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
         if parent_id:
             query += f" and '{parent_id}' in parents"
+        return query
+    
+    def _get_or_create_folder(self, folder_name: str, parent_id: Optional[str] = None) -> str:
+        """Get existing folder or create new one."""
+        key = (parent_id, folder_name)
+        if key in self._folder_ids:
+            return self._folder_ids[key]
         
-        results = self.auth.service.files().list(q=query, fields="files(id)").execute()
+        query = self._folder_query(folder_name, parent_id)
+        results = self._execute(self.auth.service.files().list(q=query, fields="files(id)"))
         folders = results.get('files', [])
         
         if folders:
+            self._folder_ids[key] = folders[0]['id']
             return folders[0]['id']
-        
+        return self._create_folder(folder_name, parent_id)
+    
+    def _create_folder(self, folder_name: str, parent_id: Optional[str] = None) -> str:
+        """Create folder and return its ID."""
         folder_metadata = {
             'name': folder_name,
             'mimeType': 'application/vnd.google-apps.folder'
@@ -45,85 +254,294 @@ class GoogleDriveManager:
         if parent_id:
             folder_metadata['parents'] = [parent_id]
         
-        folder = self.auth.service.files().create(body=folder_metadata, fields='id').execute()
-        print(f"Created folder: {folder_name}")
+        folder = self._execute(self.auth.service.files().create(body=folder_metadata, fields='id'))
+        logger.info(f"Created folder: {folder_name}")
+        self._folder_ids[(parent_id, folder_name)] = folder.get('id')
         return folder.get('id')
     
     def _setup_folders(self) -> None:
         """Setup main folder and database/files subfolders."""
         self._main_folder_id = self._get_or_create_folder(self.config.folder_name)
-        self._database_folder_id = self._get_or_create_folder("database", self._main_folder_id)
-        self._files_folder_id = self._get_or_create_folder("files", self._main_folder_id)
+        
+        cached = [self._folder_ids.get((self._main_folder_id, name)) for name in ("database", "files")]
+        if None not in cached:
+            self._database_folder_id, self._files_folder_id = cached
+            return
+        
+        # Find both subfolders with a single query
+        query = (
+            "(name='database' or name='files') and mimeType='application/vnd.google-apps.folder' "
+            f"and trashed=false and '{self._main_folder_id}' in parents"
+        )
+        results = self._execute(self.auth.service.files().list(q=query, fields="files(id,name)"))
+        
+        found: Dict[str, Optional[str]] = {"database": None, "files": None}
+        for folder in results.get('files', []):
+            if found.get(folder['name'], folder['id']) is None:
+                found[folder['name']] = folder['id']
+                self._folder_ids[(self._main_folder_id, folder['name'])] = folder['id']
+        
+        self._database_folder_id = found["database"] or self._create_folder("database", self._main_folder_id)
+        self._files_folder_id = found["files"] or self._create_folder("files", self._main_folder_id)
     
     def upload_database_backup(self, file_path: Path) -> str:
         """Upload database backup and return file ID."""
+        self.wait_authenticated()
         return self._upload_file(file_path, self._database_folder_id)
     
     def upload_files_backup(self, file_path: Path) -> str:
         """Upload files backup and return file ID."""
+        self.wait_authenticated()
         return self._upload_file(file_path, self._files_folder_id)
     
+    def upload_database_fileobj(self, file_obj: BinaryIO, name: str) -> str:
+        """Upload database backup staged in a file object and return file ID."""
+        self.wait_authenticated()
+        return self._upload_fileobj(file_obj, name, self._database_folder_id)
+    
+    def upload_files_fileobj(self, file_obj: BinaryIO, name: str) -> str:
+        """Upload files backup staged in a file object and return file ID."""
+        self.wait_authenticated()
+        return self._upload_fileobj(file_obj, name, self._files_folder_id)
+    
+    def copy_files_backup(self, file_id: str, name: str) -> str:
+        """Copy an uploaded files backup on Drive under a new name and return the copy's ID."""
+        self.wait_authenticated()
+        body = {'name': name, 'parents': [self._files_folder_id]}
+        response = self._execute(self.auth.service.files().copy(fileId=file_id, body=body, fields='id'))
+        logger.info(f"Copied: {name}")
+        return response['id']
+    
+    def upload_database_stream(self, stream: BinaryIO, name: str, mimetype: str) -> str:
+        """Upload database backup read from a stream and return file ID."""
+        self.wait_authenticated()
+        return self._upload_stream(stream, name, self._database_folder_id, mimetype)
+    
+    def upload_files_stream(self, stream: BinaryIO, name: str, mimetype: str) -> str:
+        """Upload files backup read from a stream and return file ID."""
+        self.wait_authenticated()
+        return self._upload_stream(stream, name, self._files_folder_id, mimetype)
+    
+    def upload_combined_stream(self, stream: BinaryIO, name: str, mimetype: str) -> str:
+        """Upload combined database and files backup read from a stream and return file ID."""
+        self.wait_authenticated()
+        return self._upload_stream(stream, name, self._main_folder_id, mimetype)
+    
+    def _upload_stream(self, stream: BinaryIO, name: str, folder_id: str, mimetype: str) -> str:
+        """Upload stream of unknown length to specified folder."""
+        logger.info(f"Uploading {name}...")
+        
+        file_metadata = {'name': name, 'parents': [folder_id]}
+        media = StreamUpload(stream, mimetype, self.config.chunk_size)
+        
+        request = self.auth.service.files().create(body=file_metadata, media_body=media, fields='id')
+        response = self._send_chunks(request)
+        
+        logger.info(f"Uploaded: {name}")
+        return response['id']
+    
+    def delete_file(self, file_id: str) -> None:
+        """Delete a single file by ID."""
+        self.wait_authenticated()
+        self._execute(self.auth.service.files().delete(fileId=file_id))
+        self._folder_ids = {key: value for key, value in self._folder_ids.items() if value != file_id}
+    
     def _upload_file(self, file_path: Path, folder_id: str) -> str:
         """Upload file to specified folder."""
-        print(f"Uploading {file_path.name}...")
+        with open(file_path, 'rb') as f_in:
+            return self._upload_fileobj(f_in, file_path.name, folder_id)
+    
+    def _upload_fileobj(self, file_obj: BinaryIO, name: str, folder_id: str) -> str:
+        """Upload contents of a regular or anonymous file to specified folder."""
+        logger.info(f"Uploading {name}...")
         
-        file_metadata = {'name': file_path.name, 'parents': [folder_id]}
-        media = MediaFileUpload(str(file_path), chunksize=self.config.chunk_size, resumable=True)
+        # Data may still sit in the writer's buffer
+        file_obj.flush()
         
-        request = self.auth.service.files().create(body=file_metadata, media_body=media, fields='id')
+        file_metadata = {'name': name, 'parents': [folder_id]}
+        mimetype = _guess_mimetype(name)
+        if os.fstat(file_obj.fileno()).st_size < RESUMABLE_THRESHOLD:
+            media = MediaIoBaseUpload(file_obj, mimetype=mimetype, resumable=False)
+            response = self._execute(
+                self.auth.service.files().create(body=file_metadata, media_body=media, fields='id'),
+                num_retries=UPLOAD_RETRIES
+            )
+            logger.info(f"Uploaded: {name}")
+            return response['id']
         
-        response = None
-        while response is None:
-            status, response = request.next_chunk()
-            if status:
-                print(f"Progress: {int(status.progress() * 100)}%")
+        # Chunks are read from the page cache through a read-only mapping
+        with mmap.mmap(file_obj.fileno(), 0, prot=mmap.PROT_READ) as mapped:
+            media = MappedUpload(mapped, mimetype=mimetype, chunksize=self.config.chunk_size, resumable=True)
+            request = self.auth.service.files().create(body=file_metadata, media_body=media, fields='id')
+            response = self._send_chunks(request)
         
-        print(f"Uploaded: {file_path.name}")
+        logger.info(f"Uploaded: {name}")
         return response['id']
     
-    def cleanup_database_backups(self, max_backups: int) -> None:
-        """Cleanup old database backups."""
-        self._cleanup_backups(self._database_folder_id, max_backups, "database")
+    def _execute(self, request: Union[HttpRequest, BatchHttpRequest], **kwargs: Any) -> Any:
+        """Execute request over a pooled connection."""
+        with self.auth.connection() as http:
+            return request.execute(http=http, **kwargs)
+    
+    def _send_chunks(self, request: HttpRequest) -> Dict[str, Any]:
+        """Send resumable upload chunks, reporting progress every 5%."""
+        last_step = 0
+        
+        response = None
+        with self.auth.connection() as http:
+            while response is None:
+                status, response = request.next_chunk(http=http, num_retries=UPLOAD_RETRIES)
+                if status and status.total_size:
+                    percent = int(status.progress() * 100)
+                    if percent // PROGRESS_STEP > last_step:
+                        last_step = percent // PROGRESS_STEP
+                        logger.info(f"Progress: {percent}%")
+        return response
+    
+    def new_batch(self) -> RotationBatch:
+        """Start collecting cleanups to run together at the end of a backup."""
+        return RotationBatch(self)
     
-    def cleanup_files_backups(self, max_backups: int) -> None:
-        """Cleanup old files backups."""
-        self._cleanup_backups(self._files_folder_id, max_backups, "files")
+    def cleanup_database_backups(self, max_backups: int, batch: Optional[RotationBatch] = None) -> None:
+        """Cleanup old database backups, or queue the cleanup in batch."""
+        self.wait_authenticated()
+        self._cleanup_backups(self._database_folder_id, max_backups, "database", batch)
     
-    def cleanup_files_backups_by_name(self, name_prefix: str, max_backups: int) -> None:
-        """Cleanup old files backups by specific name prefix."""
+    def cleanup_files_backups(self, max_backups: int, batch: Optional[RotationBatch] = None) -> None:
+        """Cleanup old files backups, or queue the cleanup in batch."""
+        self.wait_authenticated()
+        self._cleanup_backups(self._files_folder_id, max_backups, "files", batch)
+    
+    def cleanup_files_backups_by_name(self, name_prefix: str, max_backups: int,
+                                      batch: Optional[RotationBatch] = None, weekly: bool = False) -> None:
+        """Cleanup old files backups by specific name prefix, or queue the cleanup in batch.
+        
+        weekly keeps max_backups weeks of incremental chains instead of files.
+        """
+        self.wait_authenticated()
+        self._cleanup_backups_by_name(self._files_folder_id, name_prefix, max_backups, batch, weekly)
+    
+    def cleanup_combined_backups(self, name_prefix: str, max_backups: int,
+                                 batch: Optional[RotationBatch] = None) -> None:
+        """Cleanup old combined backups by name prefix, or queue the cleanup in batch."""
+        self.wait_authenticated()
+        self._cleanup_backups_by_name(self._main_folder_id, name_prefix, max_backups, batch)
+    
+    def _cleanup_backups_by_name(self, folder_id: str, name_prefix: str, max_backups: int,
+                                 batch: Optional[RotationBatch] = None, weekly: bool = False) -> None:
+        """Cleanup old backups in folder whose names contain name_prefix."""
         if max_backups <= 0:
             return
         
-        query = f"name contains '{name_prefix}' and '{self._files_folder_id}' in parents and trashed=false"
-        results = self.auth.service.files().list(
-            q=query,
-            orderBy='createdTime desc',
-            fields="files(id,name)"
-        ).execute()
+        query = f"name contains '{_escape(name_prefix)}' and '{folder_id}' in parents and trashed=false"
+        if batch is not None:
+            batch.add(query, max_backups, name_prefix, weekly)
+            return
         
-        files = results.get('files', [])
-        if len(files) > max_backups:
-            for file in files[max_backups:]:
-                self.auth.service.files().delete(fileId=file['id']).execute()
-                print(f"Deleted: {file['name']}")
+        excess = _excess_files(self._list_files(query), max_backups, weekly)
+        if excess:
+            self._delete_files([(file_id, name_prefix) for file_id in excess])
     
-    def _cleanup_backups(self, folder_id: str, max_backups: int, backup_type: str) -> None:
+    def _cleanup_backups(self, folder_id: str, max_backups: int, backup_type: str,
+                         batch: Optional[RotationBatch] = None) -> None:
         """Cleanup old backups in folder."""
         if max_backups <= 0:
-            print(f"Cleanup disabled for {backup_type}")
+            logger.info(f"Cleanup disabled for {backup_type}")
             return
         
         query = f"'{folder_id}' in parents and trashed=false"
-        results = self.auth.service.files().list(
-            q=query,
-            orderBy='createdTime desc',
-            fields="files(id,name)"
-        ).execute()
+        if batch is not None:
+            batch.add(query, max_backups, backup_type)
+            return
         
-        files = results.get('files', [])
+        files = self._list_files(query)
         if len(files) > max_backups:
-            for file in files[max_backups:]:
-                self.auth.service.files().delete(fileId=file['id']).execute()
-                print(f"Deleted: {file['name']}")
+            self._delete_files([(file_id, backup_type) for file_id in _excess_files(files, max_backups, False)])
         else:
-            print(f"{backup_type}: {len(files)}/{max_backups} backups")
\ No newline at end of file
+            logger.info(f"{backup_type}: {len(files)}/{max_backups} backups")
+    
+    def _rotate(self, rules: List[Tuple[str, int, str, bool]]) -> None:
+        """List files for every cleanup rule in batches, then delete the excess together."""
+        files_api = self.auth.service.files()
+        requests = [self._list_request(query) for query, _, _, _ in rules]
+        responses: Dict[str, Dict[str, Any]] = {}
+        
+        def callback(request_id: str, response: Any, exception: Optional[Exception]) -> None:
+            if exception is not None:
+                logger.error(f"Failed to list {rules[int(request_id)][2]} backups: {exception}")
+            else:
+                responses[request_id] = response
+        
+        for start in range(0, len(requests), BATCH_SIZE):
+            batch = self.auth.service.new_batch_http_request(callback=callback)
+            for index in range(start, min(start + BATCH_SIZE, len(requests))):
+                batch.add(requests[index], request_id=str(index))
+            self._execute(batch)
+        
+        to_delete = []
+        for index, (_, max_backups, backup_type, weekly) in enumerate(rules):
+            response = responses.get(str(index))
+            if response is None:
+                continue
+            
+            files = response.get('files', [])
+            # Rare locations with more than a page of backups are followed one by one
+            request = files_api.list_next(requests[index], response)
+            while request is not None:
+                response = self._execute(request)
+                files.extend(response.get('files', []))
+                request = files_api.list_next(request, response)
+            
+            excess = _excess_files(files, max_backups, weekly)
+            if excess:
+                to_delete.extend((file_id, backup_type) for file_id in excess)
+            elif weekly:
+                logger.info(f"{backup_type}: {len(files)} backups within {max_backups} weeks")
+            else:
+                logger.info(f"{backup_type}: {len(files)}/{max_backups} backups")
+        
+        if to_delete:
+            self._delete_files(to_delete)
+    
+    def _list_request(self, query: str) -> HttpRequest:
+        """Build request listing IDs and names of files matching query, newest first."""
+        return self.auth.service.files().list(
+            q=query,
+            orderBy='createdTime desc',
+            pageSize=LIST_PAGE_SIZE,
+            fields="nextPageToken,files(id,name)"
+        )
+    
+    def _list_files(self, query: str) -> List[Dict[str, str]]:
+        """List IDs and names of all files matching query, newest first, following every page."""
+        files_api = self.auth.service.files()
+        request = self._list_request(query)
+        
+        files = []
+        while request is not None:
+            response = self._execute(request)
+            files.extend(response.get('files', []))
+            request = files_api.list_next(request, response)
+        return files
+    
+    def _delete_files(self, files: List[Tuple[str, str]]) -> None:
+        """Delete (file ID, backup type) pairs using batch requests instead of one call per file."""
+        deleted: Dict[str, int] = {}
+        for _, backup_type in files:
+            deleted.setdefault(backup_type, 0)
+        
+        def callback(request_id: str, response: Any, exception: Optional[Exception]) -> None:
+            file_id, backup_type = files[int(request_id)]
+            if exception is not None:
+                logger.error(f"Failed to delete {file_id}: {exception}")
+            else:
+                deleted[backup_type] += 1
+        
+        for start in range(0, len(files), BATCH_SIZE):
+            batch = self.auth.service.new_batch_http_request(callback=callback)
+            for index in range(start, min(start + BATCH_SIZE, len(files))):
+                batch.add(self.auth.service.files().delete(fileId=files[index][0]), request_id=str(index))
+            self._execute(batch)
+        
+        for backup_type, count in deleted.items():
+            logger.info(f"Deleted {count} old {backup_type} backups")
\ No newline at end of file
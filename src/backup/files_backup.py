@@ -1,30 +1,224 @@
 """Files backup module."""
 
+import fcntl
+import fnmatch
+import hashlib
 import json
+import logging
+import os
+import re
 import shutil
+import stat
+import subprocess
 import tarfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Pattern, Tuple
 
-from .drive_manager import GoogleDriveManager
+from .compression import (
+    compressed_mimetype, compressed_suffix, compressor_command, parallel_gzip_command, resolve_format,
+    resolve_level
+)
+from .drive_manager import GoogleDriveManager, RotationBatch
+from .process import raise_if_cancelled, run_pipeline
+from .staging import staging_file
+
+logger = logging.getLogger(__name__)
+
+# Data sampled per directory to detect already-compressed content
+SAMPLE_FILES = 16
+SAMPLE_BYTES = 64 * 1024
+SAMPLE_MIN_BYTES = 4096
+INCOMPRESSIBLE_RATIO = 0.95
+
+# ioctl request cloning a file's extents on copy-on-write filesystems
+FICLONE = 0x40049409
+
+# Bytes requested per copy_file_range call
+COPY_CHUNK = 64 * 1024 * 1024
+
+
+def _compile_excludes(exclude_patterns: List[str]) -> Optional[Pattern[str]]:
+    """Compile exclude globs into one regex matching like tar --exclude.
+    
+    A pattern matches the whole member name or any trailing part of it
+    starting after a '/', so 'cache/*' also excludes 'www/cache/x'.
+    """
+    if not exclude_patterns:
+        return None
+    alternatives = "|".join(fnmatch.translate(pattern) for pattern in exclude_patterns)
+    return re.compile(f"(?:.*/)?(?:{alternatives})")
+
+
+def _tarinfo(name: str, st: os.stat_result) -> Optional[tarfile.TarInfo]:
+    """Build tar header from a stat result, or None for unsupported file types."""
+    info = tarfile.TarInfo(name)
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.uid = st.st_uid
+    info.gid = st.st_gid
+    info.mtime = st.st_mtime
+    
+    if stat.S_ISREG(st.st_mode):
+        info.type = tarfile.REGTYPE
+        info.size = st.st_size
+    elif stat.S_ISDIR(st.st_mode):
+        info.type = tarfile.DIRTYPE
+    elif stat.S_ISLNK(st.st_mode):
+        info.type = tarfile.SYMTYPE
+    else:
+        return None
+    return info
+
+
+def _scan_tree(source_path: Path, regex: Optional[Pattern[str]]) -> Iterator[Tuple[tarfile.TarInfo, Optional[str]]]:
+    """Walk directory with os.scandir, yielding tar headers and file paths.
+    
+    Uses one lstat per entry and skips the user/group name lookups done by
+    TarFile.add. Excluded directories are not descended into.
+    """
+    root_info = _tarinfo(source_path.name, os.lstat(source_path))
+    if root_info is None:
+        return
+    if root_info.issym():
+        # Like the tar binary, store a symlinked root as the link itself
+        root_info.linkname = os.readlink(source_path)
+    yield root_info, None
+    if root_info.issym():
+        return
+    
+    stack = [(str(source_path), source_path.name)]
+    while stack:
+        dir_path, dir_name = stack.pop()
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                name = f"{dir_name}/{entry.name}"
+                if regex and regex.match(name):
+                    continue
+                
+                info = _tarinfo(name, entry.stat(follow_symlinks=False))
+                if info is None:
+                    continue
+                
+                if info.issym():
+                    info.linkname = os.readlink(entry.path)
+                elif info.isdir():
+                    stack.append((entry.path, name))
+                yield info, entry.path if info.isreg() else None
+
+
+def _add_tree(tar: tarfile.TarFile, source_path: Path, exclude_patterns: List[str],
+              arcname_prefix: str = "", root_name: Optional[str] = None) -> None:
+    """Add directory tree to an open tar archive, rooted at root_name instead of its own name if given."""
+    for info, file_path in _scan_tree(source_path, _compile_excludes(exclude_patterns)):
+        if root_name is not None:
+            info.name = root_name + info.name[len(source_path.name):]
+        info.name = arcname_prefix + info.name
+        if file_path is None:
+            tar.addfile(info)
+        else:
+            with open(file_path, 'rb') as f_in:
+                tar.addfile(info, f_in)
+
+
+def _fingerprint(source_path: Path, regex: Optional[Pattern[str]], settings: str) -> str:
+    """Hash names, types, sizes, mtimes and inodes of a file or directory tree.
+    
+    Only metadata is read, so an unchanged tree is detected without
+    reading any file contents.
+    """
+    digest = hashlib.blake2b(settings.encode(), digest_size=32)
+    
+    def update(name: str, st: os.stat_result) -> None:
+        digest.update(f"{name}\0{st.st_mode}\0{st.st_size}\0{st.st_mtime_ns}\0{st.st_ino}\n".encode())
+    
+    # Symlinked items are backed up through the link, so follow it at the root
+    st = os.stat(source_path)
+    update(source_path.name, st)
+    if not stat.S_ISDIR(st.st_mode):
+        return digest.hexdigest()
+    
+    stack = [(str(source_path), source_path.name)]
+    while stack:
+        dir_path, dir_name = stack.pop()
+        with os.scandir(dir_path) as entries:
+            # Listing order is not guaranteed to be stable between runs
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                name = f"{dir_name}/{entry.name}"
+                if regex and regex.match(name):
+                    continue
+                update(name, entry.stat(follow_symlinks=False))
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, name))
+    return digest.hexdigest()
+
+
+def _fast_copy(source_path: Path, dest_path: Path) -> None:
+    """Copy file without moving data through user space where possible.
+    
+    Tries a reflink clone (btrfs/xfs), then in-kernel copy_file_range,
+    then falls back to shutil.copy2. Metadata is preserved in all cases.
+    """
+    try:
+        with open(source_path, 'rb') as f_in, open(dest_path, 'wb') as f_out:
+            try:
+                fcntl.ioctl(f_out.fileno(), FICLONE, f_in.fileno())
+            except OSError:
+                if not hasattr(os, "copy_file_range"):
+                    raise
+                # st_size is not trusted, procfs and some FUSE files report less than they hold
+                total = 0
+                while True:
+                    copied = os.copy_file_range(f_in.fileno(), f_out.fileno(), COPY_CHUNK)
+                    if copied == 0:
+                        break
+                    total += copied
+                if total == 0:
+                    # Pseudo files may not support copy_file_range at all
+                    raise OSError("copy_file_range copied nothing")
+    except OSError:
+        shutil.copy2(source_path, dest_path)
+        return
+    
+    shutil.copystat(source_path, dest_path)
 
 
 class FilesBackup:
     """Handles file and directory backups using JSON configuration."""
     
-    def __init__(self, files_config_path: Path, backup_prefix: str, compression_level: int):
+    def __init__(self, files_config_path: Path, backup_prefix: str, compression_level: Optional[int],
+                 max_workers: int = 1, compression_format: str = "gzip",
+                 temp_dir: Path = Path("/tmp/backup"), snar_dir: Path = Path("snar"),
+                 stream_upload: bool = True, long_window: bool = False,
+                 command_prefix: Optional[List[str]] = None, memory_staging: bool = False,
+                 manifest_file: Optional[Path] = None):
         self.files_config_path = files_config_path
         self.backup_prefix = backup_prefix
-        self.compression_level = compression_level
-        self.temp_dir = Path("/tmp/backup")
-        self.temp_dir.mkdir(exist_ok=True)
+        self.max_workers = max(max_workers, 1)
+        self.compression_format = resolve_format(compression_format)
+        self.compression_level = resolve_level(self.compression_format, compression_level)
+        self._tar = shutil.which("tar")
+        self.temp_dir = temp_dir
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self.snar_dir = snar_dir
+        self.stream_upload = stream_upload
+        self.long_window = long_window
+        self.command_prefix = command_prefix or []
+        self.memory_staging = memory_staging
+        # Fingerprints and Drive IDs of the last upload of each item; None disables reuse
+        self.manifest_file = manifest_file
+        self._manifest: Dict[str, Dict[str, str]] = {}
+        self._manifest_lock = threading.Lock()
+        # Name prefixes, limits and weekly chain rotation of items uploaded in the current run
+        self._rotations: List[Tuple[str, int, bool]] = []
     
     def _load_config(self) -> Dict[str, List[Dict[str, Any]]]:
         """Load and parse JSON config file with defaults."""
         if not self.files_config_path.exists():
-            print(f"Files config not found: {self.files_config_path}")
-            print("No files will be backed up. Copy files_config.example.json to files_config.json to configure file backups.")
+            logger.info(f"Files config not found: {self.files_config_path}")
+            logger.info("No files will be backed up. Copy files_config.example.json to files_config.json to configure file backups.")
             return {"directories": [], "files": []}
         
         try:
@@ -37,7 +231,7 @@ class FilesBackup:
                 "files": data.get("files", [])
             }
         except Exception as e:
-            print(f"Error loading files config: {e}")
+            logger.error(f"Error loading files config: {e}")
             return {"directories": [], "files": []}
     
     def _get_item_defaults(self, item: Dict[str, Any], source_path: Path) -> Dict[str, Any]:
@@ -46,7 +240,9 @@ class FilesBackup:
             "source": source_path,
             "name": item.get("name", source_path.name),
             "max": item.get("max", 1),
-            "exclude": item.get("exclude", []) if source_path.is_dir() else []
+            "exclude": item.get("exclude", []) if source_path.is_dir() else [],
+            "incremental": item.get("incremental", False) if source_path.is_dir() else False,
+            "snar_dir": Path(item.get("snar_dir", self.snar_dir))
         }
     
     def create_backup(self, drive_manager: GoogleDriveManager) -> bool:
@@ -54,77 +250,158 @@ class FilesBackup:
         config = self._load_config()
         
         if not config["directories"] and not config["files"]:
-            print("No file paths configured for backup")
+            logger.info("No file paths configured for backup")
             return True
         
-        print("Backing up files...")
+        logger.info("Backing up files...")
         uploaded_count = 0
+        self._rotations = []
+        self._manifest = self._load_manifest()
         
         try:
-            # Process directories
-            for dir_item in config["directories"]:
-                if self._backup_directory(dir_item, drive_manager):
-                    uploaded_count += 1
+            # Overlap archiving of one item with the upload of another
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [
+                    executor.submit(self._backup_directory, dir_item, drive_manager)
+                    for dir_item in config["directories"]
+                ] + [
+                    executor.submit(self._backup_file, file_item, drive_manager)
+                    for file_item in config["files"]
+                ]
+                
+                for future in as_completed(futures):
+                    # Queued items would only be killed once started, so drop them
+                    raise_if_cancelled(executor)
+                    if future.result():
+                        uploaded_count += 1
             
-            # Process files
-            for file_item in config["files"]:
-                if self._backup_file(file_item, drive_manager):
-                    uploaded_count += 1
-            
-            print(f"Files backup completed: {uploaded_count} items uploaded")
+            logger.info(f"Files backup completed: {uploaded_count} items uploaded")
             return True
             
         except Exception as e:
-            print(f"Files backup error: {e}")
+            logger.error(f"Files backup error: {e}")
             return False
         finally:
+            self._save_manifest()
             self._cleanup_temp_files()
     
+    def enqueue_rotation(self, drive_manager: GoogleDriveManager, batch: RotationBatch) -> None:
+        """Queue cleanup of old backups for every item uploaded in this run."""
+        for name_prefix, max_backups, weekly in self._rotations:
+            drive_manager.cleanup_files_backups_by_name(name_prefix, max_backups, batch, weekly)
+    
+    def write_into(self, tar: tarfile.TarFile, arcname_prefix: str) -> int:
+        """Add every configured directory and file to an open tar archive, returning the item count."""
+        config = self._load_config()
+        added_count = 0
+        
+        for dir_item in config["directories"]:
+            source_path = Path(dir_item["source"])
+            if not source_path.is_dir():
+                logger.warning(f"Warning: Path is not a directory: {source_path}")
+                continue
+            item = self._get_item_defaults(dir_item, source_path)
+            # Item names are unique where directory names may not be
+            _add_tree(tar, source_path, item["exclude"], arcname_prefix, item["name"])
+            added_count += 1
+        
+        for file_item in config["files"]:
+            source_path = Path(file_item["source"])
+            if not source_path.is_file():
+                logger.warning(f"Warning: Path is not a file: {source_path}")
+                continue
+            item = self._get_item_defaults(file_item, source_path)
+            # Opened through the link, so a symlinked file is added with its contents as the separate uploads do
+            with open(source_path, 'rb') as f_in:
+                tar.addfile(tar.gettarinfo(arcname=f"{arcname_prefix}{item['name']}", fileobj=f_in), f_in)
+            added_count += 1
+        
+        return added_count
+    
     def _backup_directory(self, dir_item: Dict[str, Any], drive_manager: GoogleDriveManager) -> bool:
         """Backup a single directory."""
+        # A worker may pick up a queued item before the pool is told to drop it
+        raise_if_cancelled()
         source_path = Path(dir_item["source"])
         
         if not source_path.exists():
-            print(f"Warning: Directory does not exist: {source_path}")
+            logger.warning(f"Warning: Directory does not exist: {source_path}")
             return False
         
         if not source_path.is_dir():
-            print(f"Warning: Path is not a directory: {source_path}")
+            logger.warning(f"Warning: Path is not a directory: {source_path}")
             return False
         
         item = self._get_item_defaults(dir_item, source_path)
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = self.temp_dir / f"{self.backup_prefix}_files_{item['name']}_{timestamp}.tar.gz"
+        # Rotation reads the snapshot week back from the name timestamp, so both use one clock reading
+        now = datetime.now()
+        timestamp = now.strftime("%Y%m%d_%H%M%S")
+        backup_name = f"{self.backup_prefix}_files_{item['name']}_{timestamp}.tar{compressed_suffix(self.compression_format)}"
+        
+        snar_file = None
+        if item["incremental"] and self._tar is None:
+            logger.warning(f"Warning: tar not found, creating full backup of {source_path}")
+        elif item["incremental"]:
+            snar_file = self.temp_dir / f"{self.backup_prefix}_snar_{item['name']}_{timestamp}.snar"
         
         try:
-            # Create tarball
-            self._create_tarball(source_path, backup_file, item["exclude"])
+            # Continue from this week's snapshot, or start a new level 0. Resolved
+            # once, so a run crossing into a new week keeps one chain consistent
+            snapshot = self._current_snapshot(item, now)
+            if snar_file is not None and snapshot.exists():
+                _fast_copy(snapshot, snar_file)
             
-            # Upload to Drive
-            drive_manager.upload_files_backup(backup_file)
+            # Incremental archives depend on the snapshot, so only full ones are reused
+            fingerprint = self._fingerprint(item) if snar_file is None else None
+            if self._reuse_unchanged(item, fingerprint, backup_name, drive_manager):
+                self._rotations.append((f"{self.backup_prefix}_files_{item['name']}", item["max"], False))
+                return True
             
-            # Cleanup old backups for this specific item
-            if item["max"] > 0:
-                drive_manager.cleanup_files_backups_by_name(f"{self.backup_prefix}_files_{item['name']}", item["max"])
+            level = self._choose_level(source_path, item["exclude"])
+            if self.stream_upload and self._tar is not None:
+                # Archive, compress and upload without touching the disk
+                file_id = self._stream_tarball(source_path, backup_name, item["exclude"], snar_file, level, drive_manager)
+            else:
+                with staging_file(self.temp_dir, self.memory_staging) as staged:
+                    # Create tarball
+                    self._create_tarball(source_path, staged, item["exclude"], snar_file, level)
+                    
+                    # Upload to Drive
+                    file_id = drive_manager.upload_files_fileobj(staged, backup_name)
+            self._remember(item, fingerprint, file_id)
             
-            backup_file.unlink()
+            if snar_file is not None:
+                drive_manager.upload_files_backup(snar_file)
+                self._save_snapshot(item, snar_file, snapshot)
+            
+            # Old backups of this item are cleaned up at the end of the run
+            # Incremental archives only restore on top of their week's level 0, so
+            # max counts whole weekly chains for them
+            incremental = snar_file is not None
+            self._rotations.append((f"{self.backup_prefix}_files_{item['name']}", item["max"], incremental))
+            if incremental:
+                self._rotations.append((f"{self.backup_prefix}_snar_{item['name']}", item["max"], True))
+            
+            if snar_file is not None:
+                snar_file.unlink()
             return True
             
         except Exception as e:
-            print(f"Failed to backup directory {source_path}: {e}")
+            logger.error(f"Failed to backup directory {source_path}: {e}")
             return False
     
     def _backup_file(self, file_item: Dict[str, Any], drive_manager: GoogleDriveManager) -> bool:
         """Backup a single file."""
+        raise_if_cancelled()
         source_path = Path(file_item["source"])
         
         if not source_path.exists():
-            print(f"Warning: File does not exist: {source_path}")
+            logger.warning(f"Warning: File does not exist: {source_path}")
             return False
         
         if not source_path.is_file():
-            print(f"Warning: Path is not a file: {source_path}")
+            logger.warning(f"Warning: Path is not a file: {source_path}")
             return False
         
         item = self._get_item_defaults(file_item, source_path)
@@ -133,38 +410,205 @@ class FilesBackup:
         backup_file = self.temp_dir / f"{self.backup_prefix}_files_{item['name']}_{timestamp}"
         
         try:
+            fingerprint = self._fingerprint(item)
+            if self._reuse_unchanged(item, fingerprint, backup_file.name, drive_manager):
+                self._rotations.append((f"{self.backup_prefix}_files_{item['name']}", item["max"], False))
+                return True
+            
             # Copy file
-            shutil.copy2(source_path, backup_file)
+            _fast_copy(source_path, backup_file)
             
             # Upload to Drive
-            drive_manager.upload_files_backup(backup_file)
+            file_id = drive_manager.upload_files_backup(backup_file)
+            self._remember(item, fingerprint, file_id)
             
-            # Cleanup old backups for this specific item
-            if item["max"] > 0:
-                drive_manager.cleanup_files_backups_by_name(f"{self.backup_prefix}_files_{item['name']}", item["max"])
+            # Old backups of this item are cleaned up at the end of the run
+            self._rotations.append((f"{self.backup_prefix}_files_{item['name']}", item["max"], False))
             
             backup_file.unlink()
             return True
             
         except Exception as e:
-            print(f"Failed to backup file {source_path}: {e}")
+            logger.error(f"Failed to backup file {source_path}: {e}")
+            return False
+    
+    def _fingerprint(self, item: Dict[str, Any]) -> Optional[str]:
+        """Fingerprint item contents and archive settings, or None when reuse is disabled."""
+        if self.manifest_file is None:
+            return None
+        settings = f"{self.compression_format}:{self.compression_level}:{self.long_window}:{item['exclude']}"
+        return _fingerprint(item["source"], _compile_excludes(item["exclude"]), settings)
+    
+    def _reuse_unchanged(self, item: Dict[str, Any], fingerprint: Optional[str], backup_name: str,
+                         drive_manager: GoogleDriveManager) -> bool:
+        """Copy the previous upload on Drive under backup_name if the item has not changed."""
+        entry = self._manifest.get(item["name"])
+        if fingerprint is None or entry is None or entry["fingerprint"] != fingerprint:
             return False
+        
+        try:
+            file_id = drive_manager.copy_files_backup(entry["file_id"], backup_name)
+        except Exception as e:
+            logger.warning(f"Warning: Could not reuse previous backup of {item['name']}: {e}")
+            return False
+        
+        logger.info(f"{item['source']} unchanged, copied previous backup on Drive")
+        self._remember(item, fingerprint, file_id)
+        return True
+    
+    def _remember(self, item: Dict[str, Any], fingerprint: Optional[str], file_id: str) -> None:
+        """Record the upload of an item for reuse by later runs."""
+        if fingerprint is None:
+            return
+        with self._manifest_lock:
+            self._manifest[item["name"]] = {"fingerprint": fingerprint, "file_id": file_id}
+    
+    def _manifest_key(self) -> str:
+        """Get key of this files config in the shared manifest."""
+        return str(self.files_config_path.resolve())
+    
+    def _read_manifest_file(self) -> Dict[str, Dict[str, Dict[str, str]]]:
+        """Read the manifest of all files configs."""
+        if self.manifest_file is None or not self.manifest_file.exists():
+            return {}
+        try:
+            with open(self.manifest_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Warning: Ignoring unreadable manifest {self.manifest_file}: {e}")
+            return {}
+    
+    def _load_manifest(self) -> Dict[str, Dict[str, str]]:
+        """Load fingerprints and Drive IDs of this config's items from the last runs."""
+        return self._read_manifest_file().get(self._manifest_key(), {})
     
-    def _create_tarball(self, source_path: Path, backup_file: Path, exclude_patterns: List[str]) -> None:
-        """Create compressed tarball of directory."""
-        def tar_filter(tarinfo):
-            for pattern in exclude_patterns:
-                if tarinfo.name.endswith(pattern.replace("*", "")):
-                    return None
-            return tarinfo
+    def _save_manifest(self) -> None:
+        """Write this config's entries back to the manifest, replacing it atomically."""
+        if self.manifest_file is None:
+            return
+        
+        data = self._read_manifest_file()
+        data[self._manifest_key()] = self._manifest
+        
+        try:
+            self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.manifest_file.with_name(f"{self.manifest_file.name}.tmp")
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_file, self.manifest_file)
+        except OSError as e:
+            logger.error(f"Failed to save manifest {self.manifest_file}: {e}")
+    
+    def _current_snapshot(self, item: Dict[str, Any], now: datetime) -> Path:
+        """Get snapshot file for the week of now; a new week starts a new level 0."""
+        year, week, _ = now.isocalendar()
+        return item["snar_dir"] / f"{item['name']}_{year}W{week:02d}.snar"
+    
+    def _save_snapshot(self, item: Dict[str, Any], snar_file: Path, snapshot: Path) -> None:
+        """Persist snapshot after a successful upload, dropping older weeks."""
+        snapshot.parent.mkdir(parents=True, exist_ok=True)
+        # Anchored, so item 'www' leaves the snapshots of 'www_old' alone
+        week_pattern = re.compile(rf"{re.escape(item['name'])}_\d{{4}}W\d{{2}}\.snar")
+        for old_snapshot in snapshot.parent.iterdir():
+            if old_snapshot != snapshot and week_pattern.fullmatch(old_snapshot.name):
+                old_snapshot.unlink()
+        shutil.copy2(snar_file, snapshot)
+    
+    def _choose_level(self, source_path: Path, exclude_patterns: List[str]) -> int:
+        """Pick the fastest level for directories whose data barely compresses."""
+        sample = bytearray()
+        sampled_files = 0
+        for _, file_path in _scan_tree(source_path, _compile_excludes(exclude_patterns)):
+            if file_path is None:
+                continue
+            try:
+                with open(file_path, 'rb') as f_in:
+                    sample += f_in.read(SAMPLE_BYTES)
+            except OSError:
+                continue
+            sampled_files += 1
+            if sampled_files >= SAMPLE_FILES:
+                break
+        
+        # Tiny samples do not compress regardless of content
+        if len(sample) < SAMPLE_MIN_BYTES:
+            return self.compression_level
+        if len(zlib.compress(sample, 1)) / len(sample) > INCOMPRESSIBLE_RATIO:
+            logger.info(f"{source_path} looks already compressed, using fastest compression level")
+            return 1
+        return self.compression_level
+    
+    def _create_tarball(self, source_path: Path, f_out: BinaryIO, exclude_patterns: List[str],
+                        snar_file: Optional[Path] = None, level: Optional[int] = None) -> None:
+        """Create compressed tarball of directory, incremental if snar_file is given."""
+        if level is None:
+            level = self.compression_level
+        if self._tar is not None:
+            self._create_tarball_native(source_path, f_out, exclude_patterns, snar_file, level)
+        else:
+            self._create_tarball_python(source_path, f_out, exclude_patterns, level)
+    
+    def _create_tarball_native(self, source_path: Path, f_out: BinaryIO, exclude_patterns: List[str],
+                               snar_file: Optional[Path], level: int) -> None:
+        """Create tarball with the tar binary piped into the compressor."""
+        tar_cmd = self._tar_command(source_path, exclude_patterns, snar_file)
+        compress_cmd = compressor_command(self.compression_format, level, self.long_window)
+        run_pipeline(
+            tar_cmd, compress_cmd, f_out, self.command_prefix,
+            check=lambda returncode: self._check_tar_result(source_path, returncode)
+        )
+    
+    def _stream_tarball(self, source_path: Path, backup_name: str, exclude_patterns: List[str],
+                        snar_file: Optional[Path], level: int, drive_manager: GoogleDriveManager) -> str:
+        """Pipe the tar binary through the compressor straight into a Drive upload, returning its file ID."""
+        tar_cmd = self._tar_command(source_path, exclude_patterns, snar_file)
+        compress_cmd = compressor_command(self.compression_format, level, self.long_window)
+        mimetype = compressed_mimetype(self.compression_format)
+        return run_pipeline(
+            tar_cmd, compress_cmd, lambda stream: drive_manager.upload_files_stream(stream, backup_name, mimetype),
+            self.command_prefix, check=lambda returncode: self._check_tar_result(source_path, returncode),
+            discard=drive_manager.delete_file
+        )
+    
+    def _tar_command(self, source_path: Path, exclude_patterns: List[str], snar_file: Optional[Path]) -> List[str]:
+        """Build tar command writing an archive of the directory to stdout."""
+        tar_cmd = [self._tar, "-C", str(source_path.parent)]
+        if snar_file is not None:
+            tar_cmd.append(f"--listed-incremental={snar_file}")
+        tar_cmd.extend(f"--exclude={pattern}" for pattern in exclude_patterns)
+        tar_cmd.extend(["-cf", "-", source_path.name])
+        return tar_cmd
+    
+    def _check_tar_result(self, source_path: Path, returncode: int) -> None:
+        """Raise if tar failed."""
+        # GNU tar exits with 1 when files changed while being archived
+        if returncode == 1:
+            logger.warning(f"Warning: Some files in {source_path} changed during backup")
+        elif returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self._tar)
+    
+    def _create_tarball_python(self, source_path: Path, f_out: BinaryIO, exclude_patterns: List[str],
+                               level: int) -> None:
+        """Create tarball with the tarfile module when tar is unavailable."""
+        if self.compression_format == "gzip" and parallel_gzip_command(level) is None:
+            with tarfile.open(fileobj=f_out, mode='w:gz', compresslevel=level) as tar:
+                _add_tree(tar, source_path, exclude_patterns)
+            return
+        
+        def write_tar(stream: BinaryIO) -> None:
+            with tarfile.open(fileobj=stream, mode='w|') as tar:
+                _add_tree(tar, source_path, exclude_patterns)
         
-        with tarfile.open(backup_file, 'w:gz', compresslevel=self.compression_level) as tar:
-            tar.add(source_path, arcname=source_path.name, filter=tar_filter)
+        # Stream an uncompressed tar into the multi-threaded compressor
+        compress_cmd = compressor_command(self.compression_format, level, self.long_window)
+        run_pipeline(write_tar, compress_cmd, f_out, self.command_prefix)
     
     def _cleanup_temp_files(self) -> None:
         """Clean up temporary files."""
-        for file_path in self.temp_dir.glob(f"{self.backup_prefix}_files_*"):
+        temp_files = list(self.temp_dir.glob(f"{self.backup_prefix}_files_*"))
+        temp_files += self.temp_dir.glob(f"{self.backup_prefix}_snar_*")
+        for file_path in temp_files:
             try:
                 file_path.unlink()
             except Exception as e:
-                print(f"Failed to cleanup {file_path}: {e}")
\ No newline at end of file
+                logger.error(f"Failed to cleanup {file_path}: {e}")
\ No newline at end of file
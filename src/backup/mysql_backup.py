@@ -1,27 +1,65 @@
 """MySQL backup module."""
 
+import logging
+import os
+import shutil
 import subprocess
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import BinaryIO, List, Optional
 
-from .drive_manager import GoogleDriveManager
+from .compression import (
+    compressed_mimetype, compressed_suffix, compressor_command, resolve_format, resolve_level
+)
+from .drive_manager import GoogleDriveManager, RotationBatch
+from .process import raise_if_cancelled, run_pipeline, spawn
+from .staging import staging_file
+
+logger = logging.getLogger(__name__)
+
+
+def _add_staged(tar: tarfile.TarFile, name: str, staged: BinaryIO) -> None:
+    """Add the contents of a staging file written by a subprocess to a tar archive."""
+    info = tarfile.TarInfo(name)
+    info.size = os.fstat(staged.fileno()).st_size
+    info.mtime = int(time.time())
+    staged.seek(0)
+    tar.addfile(info, staged)
 
 
 class MySQLBackup:
     """Handles MySQL database backups."""
     
     def __init__(self, host: str, user: str, password: str, databases: str, 
-                 backup_prefix: str, max_backups: int, compression_level: int):
+                 backup_prefix: str, max_backups: int, compression_level: Optional[int],
+                 backend: str = "mysqldump", threads: int = 4, compression_format: str = "gzip",
+                 compress_protocol: bool = True, quick: bool = True, compact: bool = False,
+                 temp_dir: Path = Path("/tmp/backup"), parallelism: int = 1, stream_upload: bool = True,
+                 long_window: bool = False, command_prefix: Optional[List[str]] = None,
+                 memory_staging: bool = False):
         self.host = host
         self.user = user
         self.password = password
         self.databases = databases
         self.backup_prefix = backup_prefix
         self.max_backups = max_backups
-        self.compression_level = compression_level
-        self.temp_dir = Path("/tmp/backup")
-        self.temp_dir.mkdir(exist_ok=True)
+        self.backend = backend
+        self.threads = threads
+        self.compression_format = resolve_format(compression_format)
+        self.compression_level = resolve_level(self.compression_format, compression_level)
+        self.compress_protocol = compress_protocol
+        self.quick = quick
+        self.compact = compact
+        self.parallelism = parallelism
+        self.stream_upload = stream_upload
+        self.long_window = long_window
+        self.command_prefix = command_prefix or []
+        self.memory_staging = memory_staging
+        self.temp_dir = temp_dir
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
     
     def get_database_list(self) -> List[str]:
         """Get list of databases to backup."""
@@ -31,71 +69,181 @@ class MySQLBackup:
     
     def create_backup(self, drive_manager: GoogleDriveManager) -> bool:
         """Create MySQL backup and upload to Drive."""
-        print("Backing up MySQL databases...")
+        logger.info("Backing up MySQL databases...")
+        
+        databases = self.get_database_list()
+        parallel = self.backend == "mysqldump" and self.parallelism > 1 and len(databases) > 1
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = self.temp_dir / f"{self.backup_prefix}_mysql_{timestamp}.sql"
+        if self.backend == "mydumper" or parallel:
+            backup_name = f"{self.backup_prefix}_mysql_{timestamp}.tar"
+        else:
+            backup_name = f"{self.backup_prefix}_mysql_{timestamp}.sql{compressed_suffix(self.compression_format)}"
+        dump_dir = self.temp_dir / f"mydump_{timestamp}"
         
         try:
-            # Create mysqldump command
-            cmd = [
-                "mysqldump",
-                f"--host={self.host}",
-                f"--user={self.user}",
-            ]
-            
-            if self.password:
-                cmd.append(f"--password={self.password}")
-            
-            cmd.extend(["--single-transaction", "--routines", "--triggers"])
-            
-            databases = self.get_database_list()
-            if databases:
-                cmd.extend(databases)
+            if self.backend == "mydumper" or parallel:
+                with staging_file(self.temp_dir, self.memory_staging) as staged:
+                    if parallel:
+                        self._create_parallel_backup(databases, staged, backup_name)
+                    else:
+                        self._create_mydumper_backup(dump_dir, staged, backup_name)
+                    
+                    # Upload to Drive
+                    drive_manager.upload_database_fileobj(staged, backup_name)
+            elif self.stream_upload:
+                # Dump, compress and upload without touching the disk
+                self._stream_dump(self._mysqldump_command(databases), backup_name, drive_manager)
             else:
-                cmd.append("--all-databases")
-            
-            # Run mysqldump
-            with open(backup_file, 'w') as f:
-                subprocess.run(cmd, stdout=f, check=True)
-            
-            # Compress
-            compressed_file = self._compress_file(backup_file)
-            
-            # Upload to Drive
-            drive_manager.upload_database_backup(compressed_file)
-            
-            # Cleanup temp files
-            compressed_file.unlink()
-            
-            # Cleanup old backups on Drive
-            drive_manager.cleanup_database_backups(self.max_backups)
+                with staging_file(self.temp_dir, self.memory_staging) as staged:
+                    self._dump_compressed(self._mysqldump_command(databases), staged)
+                    drive_manager.upload_database_fileobj(staged, backup_name)
             
             return True
             
         except subprocess.CalledProcessError as e:
-            print(f"MySQL backup failed: {e}")
+            logger.error(f"MySQL backup failed: {e}")
             return False
         except Exception as e:
-            print(f"MySQL backup error: {e}")
+            logger.error(f"MySQL backup error: {e}")
             return False
         finally:
             # Cleanup temp files
-            for temp_file in [backup_file, backup_file.with_suffix('.sql.gz')]:
-                if temp_file.exists():
-                    temp_file.unlink()
+            if dump_dir.exists():
+                shutil.rmtree(dump_dir, ignore_errors=True)
+    
+    def write_into(self, tar: tarfile.TarFile, arcname_prefix: str) -> None:
+        """Dump databases into an open tar archive.
+        
+        Tar headers need the member size up front, so the dump is staged
+        uncompressed first; the archive stream compresses it.
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        dump_name = f"{self.backup_prefix}_mysql_{timestamp}"
+        dump_dir = self.temp_dir / f"mydump_{timestamp}"
+        
+        try:
+            if self.backend == "mydumper":
+                self._run_mydumper(dump_dir)
+                tar.add(dump_dir, arcname=f"{arcname_prefix}{dump_name}")
+            else:
+                with staging_file(self.temp_dir, self.memory_staging) as staged:
+                    self._run_dump(self._mysqldump_command(self.get_database_list()), stdout=staged)
+                    _add_staged(tar, f"{arcname_prefix}{dump_name}.sql", staged)
+        finally:
+            if dump_dir.exists():
+                shutil.rmtree(dump_dir, ignore_errors=True)
+    
+    def enqueue_rotation(self, drive_manager: GoogleDriveManager, batch: RotationBatch) -> None:
+        """Queue cleanup of old database backups on Drive."""
+        drive_manager.cleanup_database_backups(self.max_backups, batch)
     
-    def _compress_file(self, file_path: Path) -> Path:
-        """Compress SQL file."""
-        import tarfile
+    def _mysqldump_command(self, databases: List[str]) -> List[str]:
+        """Build mysqldump command writing SQL for databases (or all) to stdout."""
+        cmd = [
+            "mysqldump",
+            f"--host={self.host}",
+            f"--user={self.user}",
+        ]
+        
+        if self.password:
+            cmd.append(f"--password={self.password}")
+        
+        cmd.extend(["--single-transaction", "--routines", "--triggers", "--extended-insert"])
+        
+        if self.compress_protocol:
+            cmd.append("--compress")
+        if self.quick:
+            cmd.append("--quick")
+        if self.compact:
+            cmd.append("--compact")
         
-        compressed_file = file_path.with_suffix('.sql.gz')
+        if databases:
+            cmd.append("--databases")
+            cmd.extend(databases)
+        else:
+            cmd.append("--all-databases")
         
-        with open(file_path, 'rb') as f_in:
-            with tarfile.open(compressed_file, 'w:gz', compresslevel=self.compression_level) as tar:
-                tarinfo = tarfile.TarInfo(name=file_path.name)
-                tarinfo.size = file_path.stat().st_size
-                tar.addfile(tarinfo, f_in)
+        return cmd
+    
+    def _create_parallel_backup(self, databases: List[str], staged: BinaryIO, backup_name: str) -> None:
+        """Dump each database with its own mysqldump and bundle them into a tar archive."""
+        suffix = compressed_suffix(self.compression_format)
+        dumps = [staging_file(self.temp_dir, self.memory_staging) for _ in databases]
         
-        file_path.unlink()
-        return compressed_file
\ No newline at end of file
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.parallelism, len(databases))) as executor:
+                futures = [
+                    executor.submit(self._dump_compressed, self._mysqldump_command([db]), dump)
+                    for db, dump in zip(databases, dumps)
+                ]
+                for future in as_completed(futures):
+                    # Queued dumps would only be killed once started, so drop them
+                    raise_if_cancelled(executor)
+                    future.result()
+            
+            # Each dump is already compressed, so the archive only bundles them
+            base_name = backup_name[:-len(".tar")]
+            with tarfile.open(fileobj=staged, mode='w') as tar:
+                for db, dump in zip(databases, dumps):
+                    _add_staged(tar, f"{base_name}/{db}.sql{suffix}", dump)
+        finally:
+            for dump in dumps:
+                dump.close()
+    
+    def _create_mydumper_backup(self, dump_dir: Path, staged: BinaryIO, backup_name: str) -> None:
+        """Dump databases with multi-threaded mydumper into a tar archive."""
+        self._run_mydumper(dump_dir)
+        
+        # mydumper already compresses each file, so the archive only bundles them
+        with tarfile.open(fileobj=staged, mode='w') as tar:
+            tar.add(dump_dir, arcname=backup_name[:-len(".tar")])
+    
+    def _run_mydumper(self, dump_dir: Path) -> None:
+        """Dump databases with multi-threaded mydumper into a directory."""
+        cmd = [
+            "mydumper",
+            f"--host={self.host}",
+            f"--user={self.user}",
+        ]
+        
+        if self.password:
+            cmd.append(f"--password={self.password}")
+        
+        cmd.extend([
+            f"--threads={self.threads}",
+            "--compress",
+            "--rows=50000",
+            "--trx-consistency-only",
+            "--routines",
+        ])
+        
+        if self.compress_protocol:
+            cmd.append("--compress-protocol")
+        
+        databases = self.get_database_list()
+        if databases:
+            for db in databases:
+                self._run_dump(cmd + [f"--outputdir={dump_dir / db}", f"--database={db}"])
+        else:
+            self._run_dump(cmd + [f"--outputdir={dump_dir}"])
+    
+    def _run_dump(self, cmd: List[str], stdout: Optional[BinaryIO] = None) -> None:
+        """Run dump command without exposing its arguments in errors."""
+        proc = spawn(self.command_prefix + cmd, stdout=stdout)
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd[0])
+    
+    def _dump_compressed(self, cmd: List[str], f_out: BinaryIO) -> None:
+        """Run dump command with its output compressed into f_out."""
+        compress_cmd = compressor_command(self.compression_format, self.compression_level, self.long_window)
+        run_pipeline(cmd, compress_cmd, f_out, self.command_prefix)
+    
+    def _stream_dump(self, cmd: List[str], backup_name: str, drive_manager: GoogleDriveManager) -> None:
+        """Pipe dump command through the compressor straight into a Drive upload."""
+        compress_cmd = compressor_command(self.compression_format, self.compression_level, self.long_window)
+        mimetype = compressed_mimetype(self.compression_format)
+        run_pipeline(
+            cmd, compress_cmd, lambda stream: drive_manager.upload_database_stream(stream, backup_name, mimetype),
+            self.command_prefix, discard=drive_manager.delete_file
+        )
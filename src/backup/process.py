@@ -0,0 +1,153 @@
+"""Scheduling priority and lifetime of backup subprocesses."""
+
+import shutil
+import subprocess
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from types import TracebackType
+from typing import AbstractSet, Any, BinaryIO, Callable, List, Optional, Sequence, Type, Union
+
+# Dumps, archivers and compressors started by the backup stages
+_spawned: "weakref.WeakSet[subprocess.Popen]" = weakref.WeakSet()
+_spawned_lock = threading.Lock()
+
+# Set by terminate_spawned; no new subprocesses or queued work start after it
+_cancelled = threading.Event()
+
+# Command, or function writing into the compressor's stdin
+Producer = Union[List[str], Callable[[BinaryIO], None]]
+# File the compressor writes into, or function uploading its output and returning the file ID
+Sink = Union[BinaryIO, Callable[[BinaryIO], str]]
+
+
+class BackupCancelled(Exception):
+    """Raised for work that would start after the backup was cancelled."""
+
+
+def priority_prefix(nice: int, cpu_set: AbstractSet[int], io_idle: bool) -> List[str]:
+    """Get command prefix running a command at lower CPU and I/O priority.
+    
+    Uses the taskset, nice and ionice wrappers rather than a preexec_fn,
+    which is not safe to use while other threads are running. Wrappers
+    that are not installed are skipped.
+    """
+    prefix = []
+    if cpu_set and shutil.which("taskset"):
+        prefix.extend(["taskset", "-c", ",".join(str(cpu) for cpu in sorted(cpu_set))])
+    if nice and shutil.which("nice"):
+        prefix.extend(["nice", "-n", str(nice)])
+    if io_idle and shutil.which("ionice"):
+        prefix.extend(["ionice", "-c", "3"])
+    return prefix
+
+
+def spawn(cmd: List[str], **kwargs: Any) -> subprocess.Popen:
+    """Start a subprocess that terminate_spawned stops if the backup is cancelled."""
+    raise_if_cancelled()
+    proc = subprocess.Popen(cmd, **kwargs)
+    with _spawned_lock:
+        _spawned.add(proc)
+    # Started while terminate_spawned ran, so it may have been missed
+    if _cancelled.is_set():
+        proc.terminate()
+    return proc
+
+
+def raise_if_cancelled(executor: Optional[ThreadPoolExecutor] = None) -> None:
+    """Raise BackupCancelled once the backup was cancelled, dropping the queued work of executor."""
+    if _cancelled.is_set():
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise BackupCancelled("Backup cancelled")
+
+
+def terminate_spawned() -> None:
+    """Send SIGTERM to spawned subprocesses that are still running and refuse new ones."""
+    _cancelled.set()
+    with _spawned_lock:
+        procs = list(_spawned)
+    for proc in procs:
+        # Does nothing for processes that have already been waited for
+        proc.terminate()
+
+
+def terminate_on_cancel(exc_type: Optional[Type[BaseException]], exc: Optional[BaseException],
+                        tb: Optional[TracebackType]) -> bool:
+    """ExitStack exit callback running terminate_spawned when the backup is cancelled.
+    
+    Push it after entering a thread pool: callbacks run in reverse, so the
+    subprocesses are stopped before the pool waits for threads blocked on
+    them. Ordinary exceptions are left to the code that raised them.
+    """
+    if exc_type is not None and not issubclass(exc_type, Exception):
+        terminate_spawned()
+    return False
+
+
+def run_pipeline(producer: Producer, compress_cmd: List[str], sink: Sink, prefix: Sequence[str] = (),
+                 check: Optional[Callable[[int], None]] = None,
+                 discard: Optional[Callable[[str], None]] = None) -> Optional[str]:
+    """Compress the output of producer into sink, returning the file ID of an upload sink.
+    
+    prefix is put in front of both commands but left out of errors, and
+    check raises for a failed producer exit status (by default any
+    non-zero one). An upload only sees EOF, so when the producer or the
+    compressor failed the upload is truncated and passed to discard.
+    """
+    upload = callable(sink)
+    stdout = subprocess.PIPE if upload else sink
+    if callable(producer):
+        proc = None
+        gz = spawn([*prefix, *compress_cmd], stdin=subprocess.PIPE, stdout=stdout)
+    else:
+        proc = spawn([*prefix, *producer], stdout=subprocess.PIPE)
+        gz = spawn([*prefix, *compress_cmd], stdin=proc.stdout, stdout=stdout)
+        # Only the compressor should hold the read end of the pipe
+        proc.stdout.close()
+    
+    file_id = None
+    with ExitStack() as stack:
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=1))
+        stack.push(terminate_on_cancel)
+        writer = executor.submit(_feed, producer, gz.stdin) if proc is None else None
+        try:
+            if upload:
+                file_id = sink(gz.stdout)
+        except (KeyboardInterrupt, SystemExit):
+            # The producer may be blocked on other subprocesses, stop them before waiting for it
+            terminate_spawned()
+            raise
+        finally:
+            if upload:
+                # A failed upload stops the compressor, which unblocks the producer
+                gz.stdout.close()
+            error = writer.exception() if writer is not None else None
+            gz.wait()
+            if proc is not None:
+                proc.wait()
+    
+    try:
+        if error is not None:
+            raise error
+        if proc is not None:
+            if check is not None:
+                check(proc.returncode)
+            elif proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, producer[0])
+        if gz.returncode != 0:
+            raise subprocess.CalledProcessError(gz.returncode, compress_cmd[0])
+    except Exception:
+        if file_id is not None and discard is not None:
+            discard(file_id)
+        raise
+    return file_id
+
+
+def _feed(producer: Callable[[BinaryIO], None], stream: BinaryIO) -> None:
+    """Run a producer function and close the stream it writes into."""
+    try:
+        producer(stream)
+    finally:
+        stream.close()
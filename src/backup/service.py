@@ -1,9 +1,31 @@
 """Backup service implementation."""
 
+import logging
+import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime
+from functools import cached_property
+from typing import TYPE_CHECKING, BinaryIO, List, Tuple, Union
+
+from .compression import (
+    compressed_mimetype, compressed_suffix, compressor_command, resolve_format, resolve_level
+)
 from .config import BackupSettings
-from .drive_manager import GoogleDriveManager
-from .mysql_backup import MySQLBackup
-from .files_backup import FilesBackup
+from .drive_manager import GoogleDriveManager, RotationBatch
+from .process import priority_prefix, run_pipeline, terminate_on_cancel
+
+if TYPE_CHECKING:
+    from .files_backup import FilesBackup
+    from .mysql_backup import MySQLBackup
+
+logger = logging.getLogger(__name__)
+
+# Stage key as used in settings and display name
+Stage = Tuple[str, str]
+
+STAGES: List[Stage] = [("mysql", "MySQL"), ("files", "Files")]
 
 
 class BackupService:
@@ -13,51 +35,177 @@ class BackupService:
         self.settings = settings
         self.drive_manager = GoogleDriveManager(settings.google_drive)
         
-        self.mysql_backup = MySQLBackup(
-            host=settings.mysql_host,
-            user=settings.mysql_user,
-            password=settings.mysql_password,
-            databases=settings.mysql_databases,
-            backup_prefix=settings.backup_name_prefix,
-            max_backups=settings.max_database_backups,
-            compression_level=settings.compression_level
+        # Keep dumps and compressors from starving other work on the host
+        self._command_prefix = priority_prefix(settings.backup_nice, settings.backup_cpu_set, settings.backup_io_idle)
+        
+        # Stages to run, fixed for the lifetime of the service
+        self._stages: List[Stage] = [stage for stage in STAGES if stage[0] in settings.enabled_stages]
+    
+    @cached_property
+    def mysql_backup(self) -> "MySQLBackup":
+        """MySQL stage, built on first use so a disabled stage costs nothing."""
+        from .mysql_backup import MySQLBackup
+        
+        return MySQLBackup(
+            host=self.settings.mysql_host,
+            user=self.settings.mysql_user,
+            password=self.settings.mysql_password,
+            databases=self.settings.mysql_databases,
+            backup_prefix=self.settings.backup_name_prefix,
+            max_backups=self.settings.max_database_backups,
+            compression_level=self.settings.get_mysql_compression_level(),
+            backend=self.settings.mysql_backend,
+            threads=self.settings.mysql_threads,
+            compression_format=self.settings.compression_format,
+            compress_protocol=self.settings.mysql_compress,
+            quick=self.settings.mysql_quick,
+            compact=self.settings.mysql_compact,
+            temp_dir=self.settings.temp_dir,
+            parallelism=min(self.settings.mysql_parallelism, len(self.settings.get_mysql_databases()) or 1, os.cpu_count() or 1),
+            stream_upload=self.settings.stream_upload,
+            long_window=self.settings.long_window,
+            command_prefix=self._command_prefix,
+            memory_staging=self.settings.memory_staging
         )
+    
+    @cached_property
+    def files_backup(self) -> "FilesBackup":
+        """Files stage, built on first use so a disabled stage costs nothing."""
+        from .files_backup import FilesBackup
         
-        self.files_backup = FilesBackup(
-            files_config_path=settings.files_config_path,
-            backup_prefix=settings.backup_name_prefix,
-            compression_level=settings.compression_level
+        return FilesBackup(
+            files_config_path=self.settings.files_config_path,
+            backup_prefix=self.settings.backup_name_prefix,
+            compression_level=self.settings.get_files_compression_level(),
+            max_workers=self.settings.concurrent_backups,
+            compression_format=self.settings.compression_format,
+            temp_dir=self.settings.temp_dir,
+            snar_dir=self.settings.snar_dir,
+            stream_upload=self.settings.stream_upload,
+            long_window=self.settings.long_window,
+            command_prefix=self._command_prefix,
+            memory_staging=self.settings.memory_staging,
+            manifest_file=self.settings.manifest_file if self.settings.skip_if_unchanged else None
         )
     
     def run_backup(self, backup_mysql: bool = True, backup_files: bool = True) -> None:
         """Run backup process with selective backup options."""
-        print("Starting backup process...")
+        stages = self._stages
+        if not (backup_mysql and backup_files):
+            selected = {"mysql": backup_mysql, "files": backup_files}
+            stages = [stage for stage in stages if selected[stage[0]]]
+        self._run(stages)
+    
+    def _run(self, stages: List[Stage]) -> None:
+        """Run backup stages and rotate old backups."""
+        logger.info("Starting backup process...")
         
-        try:
-            # Authenticate with Google Drive
-            self.drive_manager.authenticate()
+        with ExitStack() as stack:
+            # Don't leave dumps and compressors running if a stage is cancelled;
+            # failures themselves are reported by the caller
+            stack.push(terminate_on_cancel)
             
-            success_count = 0
+            # Authenticate with Google Drive while dumps and archives start;
+            # uploads wait for it on their first Drive call
+            self.drive_manager.authenticate_in_background()
             
-            # MySQL backup
-            if backup_mysql:
-                if self.mysql_backup.create_backup(self.drive_manager):
-                    success_count += 1
-                else:
-                    print("MySQL backup failed")
+            rotation = self.drive_manager.new_batch()
+            if self.settings.combined_archive:
+                success_count = self._run_combined(stages, rotation)
+            else:
+                success_count = self._run_stages(stages, rotation)
             
-            # Files backup  
-            if backup_files:
-                if self.files_backup.create_backup(self.drive_manager):
-                    success_count += 1
-                else:
-                    print("Files backup failed")
+            # Stages report their own errors, so surface a failed authentication here
+            self.drive_manager.wait_authenticated()
+            
+            # Cleanup old backups of every stage with a few batch requests
+            try:
+                rotation.execute()
+            except Exception as e:
+                logger.error(f"Cleanup of old backups failed: {e}")
             
             if success_count > 0:
-                print(f"Backup completed successfully! ({success_count} backup types completed)")
+                logger.info(f"Backup completed successfully! ({success_count} backup types completed)")
             else:
-                print("All backups failed")
-                
+                logger.error("All backups failed")
+    
+    def _run_stages(self, stages: List[Stage], rotation: RotationBatch) -> int:
+        """Run stages as separate uploads, returning the number that succeeded."""
+        if not stages:
+            return 0
+        
+        # Stages are independent, so run them side by side
+        with ExitStack() as stack:
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=len(stages)))
+            # Stage threads wait on their subprocesses, so stop those before the executor joins them
+            stack.push(terminate_on_cancel)
+            results = list(executor.map(self._run_stage, stages))
+        
+        for (key, _), succeeded in zip(stages, results):
+            if succeeded:
+                self._backup(key).enqueue_rotation(self.drive_manager, rotation)
+        return sum(results)
+    
+    def _run_stage(self, stage: Stage) -> bool:
+        """Run a single stage, reporting its failure."""
+        key, name = stage
+        try:
+            succeeded = self._backup(key).create_backup(self.drive_manager)
         except Exception as e:
-            print(f"Backup process failed: {e}")
-            raise
\ No newline at end of file
+            logger.error(f"{name} backup error: {e}")
+            succeeded = False
+        
+        if not succeeded:
+            logger.error(f"{name} backup failed")
+        return succeeded
+    
+    def _backup(self, key: str) -> Union["MySQLBackup", "FilesBackup"]:
+        """Get the backup running the stage with the given key."""
+        return self.mysql_backup if key == "mysql" else self.files_backup
+    
+    def _run_combined(self, stages: List[Stage], rotation: RotationBatch) -> int:
+        """Run stages as one combined archive, returning the number that succeeded."""
+        if not stages:
+            return 0
+        
+        names = {key for key, _ in stages}
+        try:
+            self._combined_backup("mysql" in names, "files" in names, rotation)
+            return len(stages)
+        except Exception as e:
+            logger.error(f"Combined backup failed: {e}")
+            return 0
+    
+    def _combined_backup(self, backup_mysql: bool, backup_files: bool, rotation: RotationBatch) -> None:
+        """Write MySQL dump and files into one tar stream compressed and uploaded in a single session."""
+        logger.info("Backing up into a combined archive...")
+        
+        compression_format = resolve_format(self.settings.compression_format)
+        level = resolve_level(compression_format, self.settings.compression_level)
+        compress_cmd = compressor_command(compression_format, level, self.settings.long_window)
+        
+        # Each stage set rotates on its own, so partial runs never push out full ones.
+        # Drive matches names by prefix, so no set's name may start with another's
+        stage_set = "full" if backup_mysql and backup_files else "mysql" if backup_mysql else "files"
+        name_prefix = f"{self.settings.backup_name_prefix}_combined_{stage_set}"
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_name = f"{name_prefix}_{timestamp}.tar{compressed_suffix(compression_format)}"
+        
+        # One compressor sees both sections, so its window spans SQL and files alike
+        mimetype = compressed_mimetype(compression_format)
+        run_pipeline(
+            lambda stream: self._write_combined(stream, backup_mysql, backup_files), compress_cmd,
+            lambda stream: self.drive_manager.upload_combined_stream(stream, backup_name, mimetype),
+            self._command_prefix, discard=self.drive_manager.delete_file
+        )
+        
+        logger.info(f"Combined backup completed: {backup_name}")
+        self.drive_manager.cleanup_combined_backups(name_prefix, self.settings.max_database_backups, rotation)
+    
+    def _write_combined(self, stream: BinaryIO, backup_mysql: bool, backup_files: bool) -> None:
+        """Write the combined tar archive into stream."""
+        with tarfile.open(fileobj=stream, mode='w|') as tar:
+            if backup_mysql:
+                self.mysql_backup.write_into(tar, "mysql/")
+            if backup_files:
+                self.files_backup.write_into(tar, "files/")
@@ -0,0 +1,19 @@
+"""Anonymous staging files for archives built before upload."""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO
+
+
+def staging_file(directory: Path, in_memory: bool = False) -> BinaryIO:
+    """Open an unnamed read-write file for staging an archive.
+
+    With in_memory the file lives in RAM via memfd_create, so the archive
+    is never written to and read back from disk. Otherwise it is created
+    in directory with O_TMPFILE where supported, so it never shows up in
+    the directory and disappears on close even after a crash.
+    """
+    if in_memory and hasattr(os, "memfd_create"):
+        return os.fdopen(os.memfd_create("backup", os.MFD_CLOEXEC), 'w+b')
+    return tempfile.TemporaryFile(dir=directory)